@@ -15,7 +15,7 @@ class DVIP_Base(torch.nn.Module):
         y_mean=0.0,
         y_std=1.0,
         device=None,
-        dtype=torch.float64,
+        dtype=torch.float32,
         seed=2147483647,
     ):
         """
@@ -11,7 +11,7 @@ class GenerativeFunction(torch.nn.Module):
         device=None,
         fix_random_noise=False,
         seed=2147483647,
-        dtype=torch.float64,
+        dtype=torch.float32,
     ):
         """
         Generates samples from a stochastic function using sampled
@@ -68,7 +68,7 @@ class BayesLinear(GenerativeFunction):
         fix_random_noise=False,
         zero_mean_prior=False,
         seed=0,
-        dtype=torch.float64,
+        dtype=torch.float32,
     ):
         """
         Generates samples from a stochastic Bayesian Linear function
@@ -109,7 +109,7 @@ class BayesLinear(GenerativeFunction):
 
         self.zero_mean_prior = zero_mean_prior
         # Instantiate Standard Gaussian sampler
-        self.gaussian_sampler = GaussianSampler(seed, device)
+        self.gaussian_sampler = GaussianSampler(seed, device, dtype)
 
         # If the BNN has zero mean, no parameters are considered for the
         # mean values the weights and bias variable
@@ -217,7 +217,7 @@ class SimplerBayesLinear(BayesLinear):
         fix_random_noise=False,
         zero_mean_prior=False,
         seed=0,
-        dtype=torch.float64,
+        dtype=torch.float32,
     ):
         """
         Generates samples from a stochastic Bayesian Linear function
@@ -283,7 +283,7 @@ class BayesianNN(GenerativeFunction):
         fix_random_noise=True,
         zero_mean_prior=False,
         device=None,
-        dtype=torch.float64,
+        dtype=torch.float32,
     ):
         """
         Defines a Bayesian Neural Network with multiple layers.
@@ -411,7 +411,7 @@ class BayesianConvNN(GenerativeFunction):
         seed=2147483647,
         fix_random_noise=False,
         device=None,
-        dtype=torch.float64,
+        dtype=torch.float32,
     ):
         super().__init__(
             num_samples,
@@ -484,7 +484,7 @@ class GP(GenerativeFunction):
         seed=2147483647,
         fix_random_noise=True,
         device=None,
-        dtype=torch.float64,
+        dtype=torch.float32,
     ):
         """Generates samples from a Bayesian Neural Network that
         approximates a GP with 0 mean and RBF kernel. More precisely,
@@ -549,8 +549,8 @@ class GP(GenerativeFunction):
         # Initialize variables and noise generators
         self.inner_layer_dim = inner_layer_dim
         self.inner_layer_dim_inv = 1 / self.inner_layer_dim
-        self.gaussian_sampler = GaussianSampler(seed, device)
-        self.uniform_sampler = UniformSampler(seed, device)
+        self.gaussian_sampler = GaussianSampler(seed, device, dtype)
+        self.uniform_sampler = UniformSampler(seed, device, dtype)
 
         # Initialize parameters, logarithms are used in order to avoid
         #  constraining to positive values.
@@ -626,7 +626,7 @@ class CosFunctions(GenerativeFunction):
         seed=2147483647,
         fix_random_noise=False,
         device=None,
-        dtype=torch.float64,
+        dtype=torch.float32,
     ):
         super().__init__(
             num_samples,
@@ -639,8 +639,8 @@ class CosFunctions(GenerativeFunction):
         )
 
         # Initialize variables and noise generators
-        self.gaussian_sampler = GaussianSampler(seed)
-        self.uniform_sampler = UniformSampler(seed)
+        self.gaussian_sampler = GaussianSampler(seed, device, dtype)
+        self.uniform_sampler = UniformSampler(seed, device, dtype)
 
         # Initialize parameters, logarithms are used in order to avoid
         #  constraining to positive values.
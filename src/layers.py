@@ -1,4 +1,3 @@
-import numpy as np
 import torch
 
 
@@ -42,7 +41,7 @@ class VIPLayer(Layer):
         q_sqrt_initial_value=1,
         q_mu_initial_value=0,
         mean_function=None,
-        dtype=torch.float64,
+        dtype=torch.float32,
         device=None,
     ):
         """
@@ -104,8 +103,9 @@ class VIPLayer(Layer):
         self.num_coeffs = num_regression_coeffs
 
         # Regression Coefficients prior mean
-        self.q_mu = torch.tensor(
-            np.ones((self.num_coeffs, output_dim)) * q_mu_initial_value,
+        self.q_mu = torch.full(
+            (self.num_coeffs, output_dim),
+            q_mu_initial_value,
             dtype=self.dtype,
             device=self.device,
         )
@@ -123,32 +123,32 @@ class VIPLayer(Layer):
         # Initialize the layer's noise
         if log_layer_noise is not None:
             self.log_layer_noise = torch.nn.Parameter(
-                torch.tensor(
-                    np.ones(output_dim) * log_layer_noise,
-                    dtype=self.dtype,
-                    device=self.device,
-                )
+                torch.ones(output_dim, dtype=self.dtype, device=self.device)
+                * log_layer_noise
             )
         else:
             self.log_layer_noise = log_layer_noise
 
         # Define Regression coefficients deviation using tiled triangular
-        # identity matrix
-        # Shape (num_coeffs, num_coeffs)
-        q_sqrt = np.eye(self.num_coeffs) * q_sqrt_initial_value
-        # Replicate it output_dim times
-        # Shape (num_coeffs, num_coeffs, output_dim)
-        q_sqrt = np.tile(q_sqrt[:, :, None], [1, 1, output_dim])
-        # Create tensor with triangular representation.
-        # Shape (output_dim, num_coeffs*(num_coeffs + 1)/2)
-        li, lj = torch.tril_indices(self.num_coeffs, self.num_coeffs)
-        triangular_q_sqrt = q_sqrt[li, lj]
-        self.q_sqrt_tri = torch.tensor(
-            triangular_q_sqrt,
-            dtype=self.dtype,
-            device=self.device,
+        # identity matrices. Only the lower triangular part is used.
+        # Shape (output_dim, num_coeffs, num_coeffs)
+        q_sqrt = torch.eye(
+            self.num_coeffs, dtype=self.dtype, device=self.device
+        ) * q_sqrt_initial_value
+        self.q_sqrt_full = torch.nn.Parameter(
+            q_sqrt.expand(output_dim, -1, -1).clone()
+        )
+
+        # Normalizing constant of the regression function
+        self.register_buffer(
+            "_sqrt_sm1",
+            torch.sqrt(
+                torch.tensor(
+                    self.num_coeffs - 1, dtype=self.dtype, device=self.device
+                )
+            ),
+            persistent=False,
         )
-        self.q_sqrt_tri = torch.nn.Parameter(self.q_sqrt_tri)
 
     def forward(self, X, return_prior_samples=False):
         """
@@ -201,26 +201,40 @@ class VIPLayer(Layer):
         m = torch.mean(f, dim=0, keepdims=True)
 
         # Compute regresion function, shape (S , N, 1)
-        phi = (f - m) / torch.sqrt(torch.tensor(self.num_coeffs - 1).type(self.dtype))
+        if return_prior_samples:
+            phi = (f - m) / self._sqrt_sm1
+        else:
+            # The samples are not returned, so their memory is reused. This
+            # requires the last operation of the generative function not to
+            # save its output for backward. All of them end with a matmul or
+            # an addition; one ending with e.g. exp, sigmoid or tanh would
+            # make autograd fail with "modified by an inplace operation".
+            phi = f.sub_(m).div_(self._sqrt_sm1)
 
         # Compute mean value as m + q_mu^T phi per point and output dim
         # q_mu has shape (S, D)
-        # phi has shape (S, N, 1)
-        mean = m.squeeze(axis=0) + torch.einsum("snd,sd->nd", phi, self.q_mu)
-
-        # Shape (S, S, D)
-        q_sqrt = (
-            torch.zeros((self.num_coeffs, self.num_coeffs, self.output_dim))
-            .to(self.dtype)
-            .to(self.device)
-        )
-        li, lj = torch.tril_indices(self.num_coeffs, self.num_coeffs)
-        q_sqrt[li, lj] = self.q_sqrt_tri
+        # phi has shape (S, N, 1) or (S, N, D) if the generative function
+        # outputs one value per VIP.
+        if phi.shape[-1] == 1:
+            # Single (N, S) @ (S, D) product
+            mean = m.squeeze(axis=0) + phi.squeeze(-1).T @ self.q_mu
+        else:
+            # Batched (D, N, S) @ (D, S, 1) product
+            mean = m.squeeze(axis=0) + torch.matmul(
+                phi.permute(2, 1, 0), self.q_mu.T.unsqueeze(-1)
+            ).squeeze(-1).T
+
+        # Shape (D, S, S)
+        q_sqrt = torch.tril(self.q_sqrt_full)
 
         # Compute the diagonal of the predictive covariance matrix
         # K = diag(phi^T q_sqrt^T q_sqrt phi)
-        K = torch.einsum("ind, sid -> snd", phi, q_sqrt)
-        K = torch.sum(K * K, dim=0)
+        # using one batched product over the output dimension.
+        # Shape (D, N, S)
+        phi_b = phi.permute(2, 1, 0).expand(q_sqrt.shape[0], -1, -1)
+        K = torch.bmm(phi_b, q_sqrt.transpose(-1, -2))
+        # Shape (N, D)
+        K = torch.sum(K * K, dim=-1).T
 
         # Add layer noise to variance
         if self.log_layer_noise is not None:
@@ -248,22 +262,19 @@ class VIPLayer(Layer):
                      q_mu^T q_mu - M - log |q_sqrt^T q_sqrt| )
         """
 
-        # self.q_sqrt_tri stores the triangular matrix using indexes
-        #  (0,0), (1,0), (1,1), (2,0), (2,1), (2,2), (3,0)....
-        #  knowing this, the diagonal is stored at positions 0, 2, 5, 9, 13...
-        #  which can be created using np.cumsum
-        diag_indexes = np.cumsum(np.arange(1, self.num_coeffs + 1)) - 1
-        diag = self.q_sqrt_tri[diag_indexes]
+        # Shape (D, S, S)
+        q_sqrt = torch.tril(self.q_sqrt_full)
+        diag = torch.diagonal(q_sqrt, dim1=-2, dim2=-1)
         # Constant dimensionality term
         KL = -0.5 * self.output_dim * self.num_coeffs
 
         # Log of determinant of covariance matrix.
         # Det(Sigma) = Det(q_sqrt q_sqrt^T) = Det(q_sqrt) Det(q_sqrt^T)
         #            = prod(diag_s_sqrt)^2
-        KL -= torch.sum(torch.log(torch.abs(diag)))
+        KL -= diag.abs().log().sum()
 
         # Trace term
-        KL += 0.5 * torch.sum(torch.square(self.q_sqrt_tri))
+        KL += 0.5 * torch.sum(torch.square(q_sqrt))
 
         # Mean term
         KL += 0.5 * torch.sum(torch.square(self.q_mu))
@@ -276,7 +287,7 @@ class VIPLayer(Layer):
     def freeze_posterior(self):
         """Sets the model parameters as non-trainable."""
         self.q_mu.requires_grad = False
-        self.q_sqrt_tri.requires_grad = False
+        self.q_sqrt_full.requires_grad = False
         if self.log_layer_noise:
             self.log_layer_noise.requires_grad = False
 
@@ -299,17 +310,24 @@ class VIPLayerInducing(Layer):
         q_sqrt_initial_value=1,
         q_mu_initial_value=0,
         mean_function=None,
-        dtype=torch.float64,
+        dtype=torch.float32,
+        cholesky_dtype=None,
         device=None,
     ):
         super().__init__(dtype=dtype, input_dim=input_dim, device=device)
         self.add_prior_regularization = add_prior_regularization
+        # If given, the Cholesky decomposition of Ku is computed in this
+        # dtype (e.g. torch.float64) and cast back to the layer's dtype.
+        self.cholesky_dtype = cholesky_dtype
         self.num_inducing = Z.shape[0]
-        self.inducing_points = torch.nn.Parameter(torch.tensor(Z))
+        self.inducing_points = torch.nn.Parameter(
+            torch.as_tensor(Z, dtype=self.dtype, device=self.device).clone()
+        )
 
         # Regression Coefficients prior mean
-        self.q_mu = torch.tensor(
-            np.ones((self.num_inducing, output_dim)) * q_mu_initial_value,
+        self.q_mu = torch.full(
+            (self.num_inducing, output_dim),
+            q_mu_initial_value,
             dtype=self.dtype,
             device=self.device,
         )
@@ -327,32 +345,47 @@ class VIPLayerInducing(Layer):
         # Initialize the layer's noise
         if log_layer_noise is not None:
             self.log_layer_noise = torch.nn.Parameter(
-                torch.tensor(
-                    np.ones(output_dim) * log_layer_noise,
-                    dtype=self.dtype,
-                    device=self.device,
-                )
+                torch.ones(output_dim, dtype=self.dtype, device=self.device)
+                * log_layer_noise
             )
         else:
             self.log_layer_noise = log_layer_noise
 
         # Define Regression coefficients deviation using tiled triangular
-        # identity matrix
-        # Shape (num_inducing, num_inducing)
-        q_sqrt = np.eye(self.num_inducing) * q_sqrt_initial_value
-        # Replicate it output_dim times
-        # Shape (num_inducing, num_inducing, output_dim)
-        q_sqrt = np.tile(q_sqrt[:, :, None], [1, 1, output_dim])
-        # Create tensor with triangular representation.
-        # Shape (output_dim, num_inducing*(num_inducing + 1)/2)
-        li, lj = torch.tril_indices(self.num_inducing, self.num_inducing)
-        triangular_q_sqrt = q_sqrt[li, lj]
-        self.q_sqrt_tri = torch.tensor(
-            triangular_q_sqrt,
-            dtype=self.dtype,
-            device=self.device,
+        # identity matrices. Only the lower triangular part is used.
+        # Shape (output_dim, num_inducing, num_inducing)
+        q_sqrt = torch.eye(
+            self.num_inducing, dtype=self.dtype, device=self.device
+        ) * q_sqrt_initial_value
+        self.q_sqrt_full = torch.nn.Parameter(
+            q_sqrt.expand(output_dim, -1, -1).clone()
+        )
+
+        # Normalizing constant of the regression function
+        self.register_buffer(
+            "_sqrt_sm1",
+            torch.sqrt(
+                torch.tensor(
+                    generative_function.num_samples - 1,
+                    dtype=self.dtype,
+                    device=self.device,
+                )
+            ),
+            persistent=False,
+        )
+
+        # Diagonal terms added to Ku for stability and to its Cholesky
+        # decomposition, respectively.
+        self.register_buffer(
+            "_eye_M",
+            2e-6 * torch.eye(self.num_inducing, dtype=self.dtype, device=self.device),
+            persistent=False,
+        )
+        self.register_buffer(
+            "_jitter_M",
+            1e-4 * torch.eye(self.num_inducing, dtype=self.dtype, device=self.device),
+            persistent=False,
         )
-        self.q_sqrt_tri = torch.nn.Parameter(self.q_sqrt_tri)
 
     def forward(self, X, return_prior_samples=False):
 
@@ -364,35 +397,56 @@ class VIPLayerInducing(Layer):
         f_mean = torch.mean(f, dim=0, keepdims=True)
 
         # Compute regresion function, shape (S , N, 1)
-        phi = (f - f_mean) / torch.sqrt(torch.tensor(f.shape[0] - 1).type(self.dtype))
-        f_K = torch.einsum("and, amd -> nmd", phi, phi)
-        
-        Ku = f_K[X.shape[0]:, X.shape[0]:].permute(2,0,1) + 2e-6 * torch.eye(self.num_inducing)
-        Kf = f_K[:X.shape[0], :X.shape[0]].permute(2,0,1) + 2e-6 * torch.eye(X.shape[0])
-        Kfu = f_K[:X.shape[0], X.shape[0]:].permute(2,0,1)
+        if return_prior_samples:
+            phi = (f - f_mean) / self._sqrt_sm1
+        else:
+            # The samples are not returned, so their memory is reused. This
+            # requires the last operation of the generative function not to
+            # save its output for backward. All of them end with a matmul or
+            # an addition; one ending with e.g. exp, sigmoid or tanh would
+            # make autograd fail with "modified by an inplace operation".
+            phi = f.sub_(f_mean).div_(self._sqrt_sm1)
+        # Split phi into the input and inducing locations, shape (1, N, S)
+        # and (1, M, S), or (D, N, S) and (D, M, S) if the generative
+        # function has D outputs.
+        phi = phi.permute(2, 1, 0)
+        phi_f = phi[:, :X.shape[0]]
+        phi_u = phi[:, X.shape[0]:]
+
+        # Only the needed kernel blocks are computed. Kf is only used
+        # through its diagonal, so the (N, N) matrix is never built.
+        Ku = phi_u @ phi_u.transpose(-1, -2) + self._eye_M
+        Kf_diag = torch.sum(phi_f * phi_f, -1) + 2e-6
+        Kuf = phi_u @ phi_f.transpose(-1, -2)
         
-        self.Lu = torch.linalg.cholesky(Ku+ 1e-4 * torch.eye(self.num_inducing))
+        # cholesky_ex does not check the decomposition info, avoiding a
+        # host synchronization on each forward pass.
+        if self.cholesky_dtype is None:
+            self.Lu, _ = torch.linalg.cholesky_ex(Ku + self._jitter_M)
+        else:
+            self.Lu, _ = torch.linalg.cholesky_ex(
+                (Ku + self._jitter_M).to(self.cholesky_dtype)
+            )
+            self.Lu = self.Lu.to(self.dtype)
 
-        A = torch.linalg.solve_triangular(self.Lu.permute(0,2,1), Kfu, upper=True, left= False)
-        A = torch.linalg.solve_triangular(self.Lu, A, upper=False, left = False)
+        # Ku^{-1} Kuf solved from the left by cholesky_solve, shape (D, M, N)
+        A_t = torch.cholesky_solve(Kuf, self.Lu)
+        # A = Kfu Ku^{-1} as a view, shape (D, N, M)
+        A = A_t.transpose(-1, -2)
 
-        mean = torch.einsum("dnm, md -> nd", A, self.q_mu)
+        # Batched (D, N, M) @ (D, M, 1) product, shape (N, D)
+        mean = torch.matmul(A, self.q_mu.T.unsqueeze(-1)).squeeze(-1).T
 
-        # Shape (S, S, D)
-        self.q_sqrt = (
-            torch.zeros((self.num_inducing, self.num_inducing, self.output_dim))
-            .to(self.dtype)
-            .to(self.device)
-        )
-        li, lj = torch.tril_indices(self.num_inducing, self.num_inducing)
-        self.q_sqrt[li, lj] = self.q_sqrt_tri
-        
-        SK = torch.einsum("nmd, bmd->dnb", self.q_sqrt, self.q_sqrt) - Ku
+        # Shape (D, M, M)
+        self.q_sqrt = torch.tril(self.q_sqrt_full)
         
-        B = torch.einsum("dmb, dnb -> dmn", SK, A)
+        # SK = q_sqrt q_sqrt^T - Ku in a single fused product
+        SK = torch.baddbmm(Ku, self.q_sqrt, self.q_sqrt.transpose(-1, -2), beta=-1)
         
-        delta_cov = torch.sum(A * B.permute(0, 2, 1), -1)
-        K = torch.diagonal(Kf, dim1=1, dim2=2) + delta_cov
+        # delta_cov = diag(A SK A^T), without building A SK A^T.
+        # Shape (D, N)
+        delta_cov = torch.sum(torch.matmul(A, SK) * A, -1)
+        K = Kf_diag + delta_cov
         
         # Add layer noise to variance
         if self.log_layer_noise is not None:
@@ -408,24 +462,22 @@ class VIPLayerInducing(Layer):
 
     def KL(self):
 
-        # self.q_sqrt_tri stores the triangular matrix using indexes
-        #  (0,0), (1,0), (1,1), (2,0), (2,1), (2,2), (3,0)....
-        #  knowing this, the diagonal is stored at positions 0, 2, 5, 9, 13...
-        #  which can be created using np.cumsum
-        diag_indexes = np.cumsum(np.arange(1, self.num_inducing + 1)) - 1
-        diag = self.q_sqrt_tri[diag_indexes]
+        # Shape (D, M, M)
+        q_sqrt = torch.tril(self.q_sqrt_full)
+        diag = torch.diagonal(q_sqrt, dim1=-2, dim2=-1)
         # Constant dimensionality term
         KL = -0.5 * self.output_dim * self.num_inducing
 
         # Log of determinant of covariance matrix.
         # Det(Sigma) = Det(q_sqrt q_sqrt^T) = Det(q_sqrt) Det(q_sqrt^T)
         #            = prod(diag_s_sqrt)^2
-        KL -= torch.sum(torch.log(torch.abs(diag)))
+        KL -= diag.abs().log().sum()
         
-        KL += torch.sum(torch.log(torch.abs(torch.diagonal(self.Lu, dim1=1, dim2=2))))
+        # The Cholesky factor has a positive diagonal
+        KL += torch.diagonal(self.Lu, dim1=-2, dim2=-1).log().sum()
         \
             
-        KL += 0.5 * torch.sum(torch.square(torch.linalg.solve_triangular(self.Lu, self.q_sqrt, upper=False)))
+        KL += 0.5 * torch.sum(torch.square(torch.linalg.solve_triangular(self.Lu, q_sqrt, upper=False)))
         
         Kinv_m = torch.linalg.solve_triangular(self.Lu, self.q_mu, upper = False)
         KL += 0.5 * torch.sum(self.q_mu * Kinv_m)
@@ -436,7 +488,7 @@ class VIPLayerInducing(Layer):
     def freeze_posterior(self):
         """Sets the model parameters as non-trainable."""
         self.q_mu.requires_grad = False
-        self.q_sqrt_tri.requires_grad = False
+        self.q_sqrt_full.requires_grad = False
         if self.log_layer_noise:
             self.log_layer_noise.requires_grad = False
 
@@ -459,17 +511,24 @@ class SparseGP(Layer):
         q_sqrt_initial_value=1,
         q_mu_initial_value=0,
         mean_function=None,
-        dtype=torch.float64,
+        dtype=torch.float32,
+        cholesky_dtype=None,
         device=None,
     ):
         super().__init__(dtype=dtype, input_dim=input_dim, device=device)
         self.add_prior_regularization = add_prior_regularization
+        # If given, the Cholesky decomposition of Ku is computed in this
+        # dtype (e.g. torch.float64) and cast back to the layer's dtype.
+        self.cholesky_dtype = cholesky_dtype
         self.num_inducing = Z.shape[0]
-        self.inducing_points = torch.nn.Parameter(torch.tensor(Z))
+        self.inducing_points = torch.nn.Parameter(
+            torch.as_tensor(Z, dtype=self.dtype, device=self.device).clone()
+        )
 
         # Regression Coefficients prior mean
-        self.q_mu = torch.tensor(
-            np.ones((self.num_inducing, output_dim)) * q_mu_initial_value,
+        self.q_mu = torch.full(
+            (self.num_inducing, output_dim),
+            q_mu_initial_value,
             dtype=self.dtype,
             device=self.device,
         )
@@ -484,32 +543,34 @@ class SparseGP(Layer):
         # Initialize the layer's noise
         if log_layer_noise is not None:
             self.log_layer_noise = torch.nn.Parameter(
-                torch.tensor(
-                    np.ones(output_dim) * log_layer_noise,
-                    dtype=self.dtype,
-                    device=self.device,
-                )
+                torch.ones(output_dim, dtype=self.dtype, device=self.device)
+                * log_layer_noise
             )
         else:
             self.log_layer_noise = log_layer_noise
 
         # Define Regression coefficients deviation using tiled triangular
-        # identity matrix
-        # Shape (num_inducing, num_inducing)
-        q_sqrt = np.eye(self.num_inducing) * q_sqrt_initial_value
-        # Replicate it output_dim times
-        # Shape (num_inducing, num_inducing, output_dim)
-        q_sqrt = np.tile(q_sqrt[:, :, None], [1, 1, output_dim])
-        # Create tensor with triangular representation.
-        # Shape (output_dim, num_inducing*(num_inducing + 1)/2)
-        li, lj = torch.tril_indices(self.num_inducing, self.num_inducing)
-        triangular_q_sqrt = q_sqrt[li, lj]
-        self.q_sqrt_tri = torch.tensor(
-            triangular_q_sqrt,
-            dtype=self.dtype,
-            device=self.device,
+        # identity matrices. Only the lower triangular part is used.
+        # Shape (output_dim, num_inducing, num_inducing)
+        q_sqrt = torch.eye(
+            self.num_inducing, dtype=self.dtype, device=self.device
+        ) * q_sqrt_initial_value
+        self.q_sqrt_full = torch.nn.Parameter(
+            q_sqrt.expand(output_dim, -1, -1).clone()
+        )
+
+        # Diagonal terms added to Ku for stability and to its Cholesky
+        # decomposition, respectively.
+        self.register_buffer(
+            "_eye_M",
+            2e-6 * torch.eye(self.num_inducing, dtype=self.dtype, device=self.device),
+            persistent=False,
+        )
+        self.register_buffer(
+            "_jitter_M",
+            1e-4 * torch.eye(self.num_inducing, dtype=self.dtype, device=self.device),
+            persistent=False,
         )
-        self.q_sqrt_tri = torch.nn.Parameter(self.q_sqrt_tri)
         
         self.log_lengthscale = torch.nn.Parameter(torch.tensor(0., dtype=self.dtype, device = self.device))
         self.log_amplitude = torch.nn.Parameter(torch.tensor(0., dtype=self.dtype, device = self.device))
@@ -524,40 +585,62 @@ class SparseGP(Layer):
         x1_ = x1 / torch.exp(self.log_lengthscale)
         x2_ = x2 / torch.exp(self.log_lengthscale)
         
-        dist = torch.sum((x1_.unsqueeze(1) - x2_.unsqueeze(0))**2, -1)
+        # Squared distances as ||x1||^2 + ||x2||^2 - 2 x1 x2^T, which only
+        # needs one (N1, N2) product instead of a (N1, N2, D) difference.
+        x1_norm = torch.sum(x1_ * x1_, -1, keepdim=True)
+        x2_norm = torch.sum(x2_ * x2_, -1, keepdim=True).T
+        dist = torch.clamp(x1_norm + x2_norm - 2.0 * (x1_ @ x2_.T), min=0.0)
         return torch.exp(self.log_amplitude) * torch.exp(-dist).unsqueeze(0)
+
+    def kernel_diag(self, x):
+        # x is (N, D)
+        # As ||x - x||^2 = 0, the diagonal is the kernel amplitude.
+        # Shape (1, N)
+        return torch.exp(self.log_amplitude).expand(1, x.shape[0])
         
         
     def forward(self, X, return_prior_samples=False):
         
         
-        Ku = self.kernel(self.inducing_points) + 2e-6 * torch.eye(self.num_inducing)
-
-        Kf = self.kernel(X) + 2e-6 * torch.eye(X.shape[0])
-        Kfu = self.kernel(X, self.inducing_points)
+        # Ku and Kuf are computed by a single kernel call between the
+        # inducing points and the union of the inducing and input points.
+        # Shape (1, M, M + N)
+        Z_and_X = torch.cat([self.inducing_points, X], dim=0)
+        K_u = self.kernel(self.inducing_points, Z_and_X)
+        Ku = K_u[:, :, :self.num_inducing] + self._eye_M
+        Kuf = K_u[:, :, self.num_inducing:]
+
+        # Only the diagonal of Kf is used, so the (N, N) matrix is not built
+        Kf_diag = self.kernel_diag(X) + 2e-6
         
-        self.Lu = torch.linalg.cholesky(Ku +  1e-4 * torch.eye(self.num_inducing))
+        # cholesky_ex does not check the decomposition info, avoiding a
+        # host synchronization on each forward pass.
+        if self.cholesky_dtype is None:
+            self.Lu, _ = torch.linalg.cholesky_ex(Ku + self._jitter_M)
+        else:
+            self.Lu, _ = torch.linalg.cholesky_ex(
+                (Ku + self._jitter_M).to(self.cholesky_dtype)
+            )
+            self.Lu = self.Lu.to(self.dtype)
 
-        A = torch.linalg.solve_triangular(self.Lu.permute(0,2,1), Kfu, upper=True, left= False)
-        A = torch.linalg.solve_triangular(self.Lu, A, upper=False, left = False)
+        # Ku^{-1} Kuf solved from the left by cholesky_solve, shape (D, M, N)
+        A_t = torch.cholesky_solve(Kuf, self.Lu)
+        # A = Kfu Ku^{-1} as a view, shape (D, N, M)
+        A = A_t.transpose(-1, -2)
 
-        mean = torch.einsum("dnm, md -> nd", A, self.q_mu)
+        # Batched (D, N, M) @ (D, M, 1) product, shape (N, D)
+        mean = torch.matmul(A, self.q_mu.T.unsqueeze(-1)).squeeze(-1).T
 
-        # Shape (S, S, D)
-        self.q_sqrt = (
-            torch.zeros((self.num_inducing, self.num_inducing, self.output_dim))
-            .to(self.dtype)
-            .to(self.device)
-        )
-        li, lj = torch.tril_indices(self.num_inducing, self.num_inducing)
-        self.q_sqrt[li, lj] = self.q_sqrt_tri
-        
-        SK = torch.einsum("nmd, bmd->dnb", self.q_sqrt, self.q_sqrt) - Ku
+        # Shape (D, M, M)
+        self.q_sqrt = torch.tril(self.q_sqrt_full)
         
-        B = torch.einsum("dmb, dnb -> dmn", SK, A)
+        # SK = q_sqrt q_sqrt^T - Ku in a single fused product
+        SK = torch.baddbmm(Ku, self.q_sqrt, self.q_sqrt.transpose(-1, -2), beta=-1)
         
-        delta_cov = torch.sum(A * B.permute(0, 2, 1), -1)
-        K = torch.diagonal(Kf, dim1=1, dim2=2) + delta_cov
+        # delta_cov = diag(A SK A^T), without building A SK A^T.
+        # Shape (D, N)
+        delta_cov = torch.sum(torch.matmul(A, SK) * A, -1)
+        K = Kf_diag + delta_cov
         
         # Add layer noise to variance
         if self.log_layer_noise is not None:
@@ -573,24 +656,22 @@ class SparseGP(Layer):
 
     def KL(self):
 
-        # self.q_sqrt_tri stores the triangular matrix using indexes
-        #  (0,0), (1,0), (1,1), (2,0), (2,1), (2,2), (3,0)....
-        #  knowing this, the diagonal is stored at positions 0, 2, 5, 9, 13...
-        #  which can be created using np.cumsum
-        diag_indexes = np.cumsum(np.arange(1, self.num_inducing + 1)) - 1
-        diag = self.q_sqrt_tri[diag_indexes]
+        # Shape (D, M, M)
+        q_sqrt = torch.tril(self.q_sqrt_full)
+        diag = torch.diagonal(q_sqrt, dim1=-2, dim2=-1)
         # Constant dimensionality term
         KL = -0.5 * self.output_dim * self.num_inducing
 
         # Log of determinant of covariance matrix.
         # Det(Sigma) = Det(q_sqrt q_sqrt^T) = Det(q_sqrt) Det(q_sqrt^T)
         #            = prod(diag_s_sqrt)^2
-        KL -= torch.sum(torch.log(torch.abs(diag)))
+        KL -= diag.abs().log().sum()
         
-        KL += torch.sum(torch.log(torch.abs(torch.diagonal(self.Lu, dim1=1, dim2=2))))
+        # The Cholesky factor has a positive diagonal
+        KL += torch.diagonal(self.Lu, dim1=-2, dim2=-1).log().sum()
         \
             
-        KL += 0.5 * torch.sum(torch.square(torch.linalg.solve_triangular(self.Lu, self.q_sqrt, upper=False)))
+        KL += 0.5 * torch.sum(torch.square(torch.linalg.solve_triangular(self.Lu, q_sqrt, upper=False)))
         
         Kinv_m = torch.linalg.solve_triangular(self.Lu, self.q_mu, upper = False)
         KL += 0.5 * torch.sum(self.q_mu * Kinv_m)
@@ -601,7 +682,7 @@ class SparseGP(Layer):
     def freeze_posterior(self):
         """Sets the model parameters as non-trainable."""
         self.q_mu.requires_grad = False
-        self.q_sqrt_tri.requires_grad = False
+        self.q_sqrt_full.requires_grad = False
         if self.log_layer_noise:
             self.log_layer_noise.requires_grad = False
 
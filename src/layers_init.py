@@ -1,21 +1,138 @@
+import contextlib
+import logging
+import os
+from functools import partial
+
 import numpy as np
 import torch
 from scipy.cluster.vq import kmeans2
 from src.generative_functions import *
 from src.layers import VIPLayer, VIPLayerInducing, SparseGP
 
+logger = logging.getLogger(__name__)
+
+# Optional dependencies for the k-means initialization of inducing points.
+# If scikit-learn is not available, a Numba compiled Lloyd algorithm is
+# used, falling back to scipy's kmeans2.
+try:
+    from sklearn.cluster import MiniBatchKMeans
+except ImportError:
+    MiniBatchKMeans = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# threadpoolctl is installed along with scikit-learn. Without it, BLAS
+# keeps its default number of threads.
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:
+
+    def threadpool_limits(limits=None, user_api=None):
+        return contextlib.nullcontext()
+
+
+if numba is not None:
+
+    @numba.njit(parallel=True, cache=True)
+    def _lloyd_assign(X, X_sq, C):
+        """Assigns each row of X to its closest centroid in C, using
+        ||x - c||^2 = ||x||^2 + ||c||^2 - 2 x^T c."""
+        N, D = X.shape
+        K = C.shape[0]
+        C_sq = np.zeros(K, dtype=C.dtype)
+        for j in range(K):
+            for d in range(D):
+                C_sq[j] += C[j, d] * C[j, d]
+
+        labels = np.empty(N, dtype=np.int64)
+        for i in numba.prange(N):
+            best_dist = np.inf
+            best_j = 0
+            for j in range(K):
+                dot = 0.0
+                for d in range(D):
+                    dot += X[i, d] * C[j, d]
+                dist = X_sq[i] + C_sq[j] - 2.0 * dot
+                if dist < best_dist:
+                    best_dist = dist
+                    best_j = j
+            labels[i] = best_j
+        return labels
+
+    @numba.njit(cache=True)
+    def _lloyd_update(X, labels, C):
+        """Computes the mean of the points assigned to each centroid.
+        Centroids with no assigned points are kept."""
+        N, D = X.shape
+        K = C.shape[0]
+        sums = np.zeros((K, D), dtype=C.dtype)
+        counts = np.zeros(K, dtype=np.int64)
+        for i in range(N):
+            counts[labels[i]] += 1
+            for d in range(D):
+                sums[labels[i], d] += X[i, d]
+        for j in range(K):
+            for d in range(D):
+                if counts[j] == 0:
+                    sums[j, d] = C[j, d]
+                else:
+                    sums[j, d] /= counts[j]
+        return sums
+
+
+def _numba_kmeans(X, k, seed, n_iter=10):
+    """
+    Lloyd's k-means algorithm compiled with Numba. As kmeans2 with
+    minit="points", centroids are initialized as random data points.
+
+    Parameters
+    ----------
+    X : np.ndarray of shape (N, D)
+        Data to cluster.
+    k : int
+        Number of clusters.
+    seed : int
+           Seed of the centroids initialization.
+    n_iter : int
+             Maximum number of iterations.
+
+    Returns
+    -------
+    C : np.ndarray of shape (k, D)
+        Cluster centroids.
+    """
+    X = np.ascontiguousarray(X)
+    rng = np.random.default_rng(seed)
+    C = X[rng.choice(X.shape[0], size=k, replace=False)]
+    X_sq = np.sum(X * X, axis=1)
+    for _ in range(n_iter):
+        labels = _lloyd_assign(X, X_sq, C)
+        C_new = _lloyd_update(X, labels, C)
+        if np.array_equal(C_new, C):
+            break
+        C = C_new
+    return C
+
 
 class LinearProjection:
-    def __init__(self, matrix, device):
+    def __init__(self, matrix, device, dtype=torch.float64):
         """
         Encapsulates a linear projection defined by a Matrix
 
         Parameters
         ----------
-        matrix : Torch tensor of shape (N, M)
-                 Contains the linear projection
+        matrix : Torch tensor or np.ndarray of shape (N, M)
+                 Contains the linear projection. No copy is made if
+                 it is already a tensor with the given dtype and device.
+        device : torch.device
+                 The device in which the computations are made.
+        dtype : data-type
+                The dtype of the projection matrix.
         """
-        self.P = torch.tensor(matrix, dtype=torch.float64, device=device)
+        self.P = torch.as_tensor(matrix, dtype=dtype, device=device)
 
     def __call__(self, inputs):
         """
@@ -24,6 +141,79 @@ class LinearProjection:
         return inputs @ self.P
 
 
+def _tall_svd(X, k):
+    """
+    Computes the top k right singular vectors of a tall matrix using
+    its thin QR decomposition, X = QR, and the SVD of the small R factor.
+    As Q is orthonormal, X and R share their right singular vectors.
+
+    The decomposition is always computed on CPU with NumPy, as GPU SVD
+    routines are much slower for tall and skinny matrices.
+
+    Parameters
+    ----------
+    X : np.ndarray or torch tensor of shape (N, D)
+        Matrix to decompose. Torch tensors are moved to CPU.
+    k : int
+        Number of singular vectors to return.
+
+    Returns
+    -------
+    V : np.ndarray of shape (k, D)
+        Right singular vectors in decreasing singular value order.
+    """
+    if isinstance(X, torch.Tensor):
+        X = X.detach().cpu().numpy()
+    R = np.linalg.qr(X, mode="r")
+    _, _, V = np.linalg.svd(R, full_matrices=False)
+    return V[:k]
+
+
+def _to_device(arrays, device, dtype):
+    """
+    Transfers a list of NumPy arrays to the device using a single copy.
+    On CUDA devices, the copy is made asynchronously from pinned memory,
+    so that it overlaps with the remaining initialization work.
+
+    Parameters
+    ----------
+    arrays : list of np.ndarray
+             Arrays to transfer.
+    device : torch.device
+             The device in which the computations are made.
+    dtype : data-type
+            The dtype of the resulting tensors.
+
+    Returns
+    -------
+    tensors : list of torch tensors
+              Tensors with the shapes of the given arrays. These are
+              views of a single buffer in the device.
+    """
+    if len(arrays) == 0:
+        return []
+
+    flat = np.concatenate([a.ravel() for a in arrays])
+    if device is not None and torch.device(device).type == "cuda":
+        flat = torch.as_tensor(flat, dtype=dtype).pin_memory()
+        flat = flat.to(device=device, non_blocking=True)
+    else:
+        flat = torch.as_tensor(flat, dtype=dtype, device=device)
+
+    tensors = torch.split(flat, [a.size for a in arrays])
+    return [t.view(a.shape) for t, a in zip(tensors, arrays)]
+
+
+class IdentityProjection:
+    """
+    Identity mean function. Equivalent to a LinearProjection with the
+    identity matrix, without performing the matrix product.
+    """
+
+    def __call__(self, inputs):
+        return inputs
+
+
 def init_layers(
     X,
     output_dim,
@@ -50,6 +240,8 @@ def init_layers(
     zero_mean_prior,
     input_prop,
     inducing_layer,
+    compile_layers=False,
+    cholesky_dtype=None,
     **kwargs
 ):
     """
@@ -64,8 +256,11 @@ def init_layers(
 
     Parameters
     ----------
-    X : tf.tensor of shape (num_data, data_dim)
-        Contains the input features.
+    X : np.ndarray or torch tensor of shape (num_data, data_dim)
+        Contains the input features. It is never modified, and
+        only copied when it is not a float64 NumPy array, so it
+        must not be mutated by the caller while the layers are
+        being initialized.
     output_dim : int
                  Number of output dimensions of the model.
     vip_layers : integer or list of integers
@@ -134,30 +329,84 @@ def init_layers(
                KL.
     zero_mean_prior : boolean
                       Wether to restraint the prior to have zero mean.
+    compile_layers : boolean
+                     Wether to compile the forward pass of each layer
+                     using torch.compile. Requires PyTorch >= 2.2.
+    cholesky_dtype : data-type
+                     If given, dtype in which the Cholesky decomposition
+                     of Ku is computed in the inducing layers.
     """
-    Z = kmeans2(X, 100, minit="points", seed = 0)[0]
+    if compile_layers and not hasattr(torch.nn.Module, "compile"):
+        raise RuntimeError("Compiling the layers requires PyTorch >= 2.2.")
+
+    if isinstance(X, torch.Tensor):
+        X = X.detach().cpu().numpy()
+
+    # The k-means centroids and the PCA projections are low-rank summaries
+    # of the data used as initialization, so they are computed over a
+    # random subset of at most 20000 points. This does not affect training,
+    # which always uses the full dataset.
+    if X.shape[0] > 20000:
+        rng = np.random.default_rng(seed)
+        X_sub = X[rng.choice(X.shape[0], size=20000, replace=False)]
+    else:
+        X_sub = X
+    # The Gram matrix squares the condition number of the data, so the PCA
+    # is computed in double precision. Single precision is enough for the
+    # k-means centroids and halves their memory traffic.
+    X_sub = np.asarray(X_sub, dtype=np.float64)
+
+    # Number of BLAS threads used by the k-means and PCA computations. One
+    # thread per core, unless the data is small enough for the threads
+    # overhead to dominate.
+    blas_threads = 1 if X_sub.shape[0] * X_sub.shape[1] < 1e6 else os.cpu_count()
+
+    # Inducing points are initialized as k-means centroids, only needed by
+    # inducing layers. Minibatch k-means is used unless the data fits in a
+    # single batch. Without scikit-learn, the Numba implementation is used
+    # for large problems.
+    if inducing_layer:
+        X32 = X_sub.astype(np.float32)
+        with threadpool_limits(limits=blas_threads, user_api="blas"):
+            if X32.shape[0] <= 1024:
+                Z = kmeans2(X32, 100, minit="points", seed = 0)[0]
+            elif MiniBatchKMeans is not None:
+                Z = MiniBatchKMeans(
+                    n_clusters=100, batch_size=1024, n_init=1, random_state=0
+                ).fit(X32).cluster_centers_
+            elif numba is not None and X32.shape[0] * 100 * X32.shape[1] > 1e7:
+                Z = _numba_kmeans(X32, 100, seed=0)
+            else:
+                Z = kmeans2(X32, 100, minit="points", seed = 0)[0]
 
     # Create VIP layers. If integer, replicate input dimension. For example,
     # for a data of shape (N, D), vip_layers = 4 would generate layers with
     # dimensions D-D-D-output_dim
-    if len(vip_layers) == 1:
-        vip_layers = [X.shape[1]] * (vip_layers[0] - 1)
-        dims = [X.shape[1]] + vip_layers + [output_dim]
     # If not an integer, an array is accepted where the last position must
     # be the output dimension.
+    if len(vip_layers) > 1 and vip_layers[-1] != output_dim:
+        raise RuntimeError("Last vip layer does not correspond with data label")
+    if len(vip_layers) == 1:
+        # As with the former list construction, at least one layer is
+        # created, even for vip_layers = 0.
+        dims = (X.shape[1],) * max(vip_layers[0], 1) + (output_dim,)
     else:
-        if vip_layers[-1] != output_dim:
-            raise RuntimeError("Last vip layer does not correspond with data label")
-        dims = [X.shape[1]] + vip_layers
+        dims = (X.shape[1],) + tuple(vip_layers)
 
-    # Initialize layers array
-    layers = []
-    # We maintain a copy of X, where each projection is applied. That is,
-    # if two data reductions are made, the matrix of the second is computed
-    # using the projected (from the first projection) data.
-    X_running = np.copy(X)
-    for (i, (dim_in, dim_out)) in enumerate(zip(dims[:-1], dims[1:])):
-        print("Layer {}: {}->{}".format(i, dim_in, dim_out), end=" ")
+    # Layers are created in two passes. The first one computes the
+    # configuration of each layer, including the projection matrices of the
+    # mean functions, using NumPy. The second one creates the torch modules.
+    configs = []
+    # Each projection is computed over the already projected data. Only the
+    # right singular vectors of the data are needed, that is, the
+    # eigenvectors of its D x D Gram matrix X^T X. After a projection P,
+    # the Gram matrix of X P is P^T X^T X P, so it is computed once and
+    # projected at each data reduction, without touching X again.
+    gram = None
+    # Composition of the projections applied so far
+    P_running = None
+    for (i, (dim_in, dim_out)) in enumerate(zip(dims, dims[1:])):
+        P = None
 
         # Last layer has no transformation
         if i == len(dims) - 2:
@@ -165,12 +414,10 @@ def init_layers(
             q_mu_initial_value = final_layer_mu
             q_sqrt_initial_value = final_layer_sqrt
             log_layer_noise = final_layer_noise
-            print("MF: None")
 
         # No dimension change, identity matrix
         elif dim_in == dim_out:
-            mf = LinearProjection(np.identity(n=dim_in), device=device)
-            print("MF: Identity")
+            mf = "identity"
             q_mu_initial_value = inner_layers_mu
             q_sqrt_initial_value = inner_layers_sqrt
             log_layer_noise = inner_layers_noise
@@ -180,13 +427,29 @@ def init_layers(
             q_mu_initial_value = inner_layers_mu
             q_sqrt_initial_value = inner_layers_sqrt
             log_layer_noise = inner_layers_noise
-            _, _, V = np.linalg.svd(X_running, full_matrices=False)
+            with threadpool_limits(limits=blas_threads, user_api="blas"):
+                if gram is None:
+                    gram = X_sub.T @ X_sub
+                w, U = np.linalg.eigh(gram)
+                # Eigenvalues are in ascending order, cond = sqrt(w[-1] / w[0]).
+                # Squaring the condition number loses precision, so when the
+                # smallest eigenvalue is below the precision of the Gram
+                # matrix the projected data is materialized and its SVD is
+                # computed instead.
+                if w[0] > w[-1] * 100 * np.finfo(gram.dtype).eps:
+                    V = np.ascontiguousarray(U[:, ::-1].T)
+                else:
+                    X_running = X_sub if P_running is None else X_sub @ P_running
+                    V = _tall_svd(X_running, dim_out)
 
-            mf = LinearProjection(V[:dim_out, :].T, device=device)
-            print("MF: Proyection")
+            # Projection matrix of shape (dim_in, dim_out), stored contiguously
+            # as it is used both for the mean function and the running data.
+            P = np.ascontiguousarray(V[:dim_out].T)
+            mf = "projection"
 
-            # Apply the projection to the running data,
-            X_running = X_running @ V[:dim_out].T
+            # Apply the projection to the running Gram matrix
+            gram = P.T @ gram @ P
+            P_running = P if P_running is None else P_running @ P
 
         else:
             raise NotImplementedError(
@@ -195,50 +458,87 @@ def init_layers(
 
         if not input_prop and i < 1:
             mf = None
-            print("MF: None")
 
-        out = dim_out if genf_full_output else 1
-        # Create the Generation function
-        if genf == "conv" and i == 0:
-            f = BayesianConvNN(
-                num_samples=regression_coeffs,
-                input_dim=(28, 28),
-                activation=activation,
-                output_dim=out,
-                fix_random_noise=fix_prior_noise,
-                device=device,
-                seed=seed,
-                dtype=dtype,
-            )
-        elif genf == "GP":
-            f = GP(
-                num_samples=regression_coeffs,
-                input_dim=dim_in,
-                output_dim=out,
-                inner_layer_dim=bnn_inner_dim,
-                kernel_amp=1,
-                kernel_length=1,
-                seed=seed,
-                fix_random_noise=fix_prior_noise,
-                device=device,
-                dtype=dtype,
+        logger.debug("Layer %d: %d->%d MF: %s", i, dim_in, dim_out, mf)
+        configs.append(
+            (
+                dim_in,
+                dim_out,
+                mf,
+                P,
+                q_mu_initial_value,
+                q_sqrt_initial_value,
+                log_layer_noise,
             )
+        )
 
-        else:
-            f = BayesianNN(
-                num_samples=regression_coeffs,
-                input_dim=dim_in,
-                structure=bnn_structure,
-                activation=activation,
-                output_dim=out,
-                layer_model=bnn_layer,
-                dropout=dropout,
-                fix_random_noise=fix_prior_noise,
-                zero_mean_prior=zero_mean_prior,
-                device=device,
-                seed=seed,
-                dtype=dtype,
-            )
+    # All the projection matrices and the inducing points are transferred
+    # to the device at once.
+    arrays = [P for (_, _, mf, P, _, _, _) in configs if mf == "projection"]
+    if inducing_layer:
+        arrays.append(Z)
+    tensors = _to_device(arrays, device=device, dtype=dtype)
+    if inducing_layer:
+        Z = tensors.pop()
+    projections = iter(tensors)
+
+    # Generative function factories. The parameters shared by every layer
+    # are fixed here, so only the dimensions are given inside the loop.
+    common = dict(
+        num_samples=regression_coeffs,
+        fix_random_noise=fix_prior_noise,
+        device=device,
+        seed=seed,
+        dtype=dtype,
+    )
+    factories = {
+        "conv": lambda input_dim, output_dim: BayesianConvNN(
+            input_dim=(28, 28),
+            activation=activation,
+            output_dim=output_dim,
+            **common
+        ),
+        "GP": partial(
+            GP,
+            inner_layer_dim=bnn_inner_dim,
+            kernel_amp=1,
+            kernel_length=1,
+            **common
+        ),
+        None: partial(
+            BayesianNN,
+            structure=bnn_structure,
+            activation=activation,
+            layer_model=bnn_layer,
+            dropout=dropout,
+            zero_mean_prior=zero_mean_prior,
+            **common
+        ),
+    }
+
+    # Initialize layers array
+    layers = []
+    for (i, config) in enumerate(configs):
+        (
+            dim_in,
+            dim_out,
+            mf,
+            _,
+            q_mu_initial_value,
+            q_sqrt_initial_value,
+            log_layer_noise,
+        ) = config
+
+        if mf == "identity":
+            mf = IdentityProjection()
+        elif mf == "projection":
+            mf = LinearProjection(next(projections), device=device, dtype=dtype)
+
+        out = dim_out if genf_full_output else 1
+        # Create the Generation function. The convolutional network is
+        # only used on the first layer, as it works on the raw images.
+        key = genf if genf in factories and (genf != "conv" or i == 0) else None
+        f = factories[key](input_dim=dim_in, output_dim=out)
 
         # Create layer
         
@@ -256,6 +556,7 @@ def init_layers(
                 log_layer_noise=log_layer_noise,
                 q_sqrt_initial_value=q_sqrt_initial_value,
                 dtype=dtype,
+                cholesky_dtype=cholesky_dtype,
                 device=device,
             )
         else:
@@ -272,6 +573,14 @@ def init_layers(
                 dtype=dtype,
                 device=device,
             )
+
+        if compile_layers:
+            # Fuses the elementwise operations and reductions of the forward
+            # pass. Python arguments such as return_prior_samples are guarded
+            # on, so each of their values gets its own compiled graph.
+            # Compiling the module, instead of its bound forward method,
+            # keeps copies and pickles of the layer working as usual.
+            layer.compile()
         
         layers.append(
             layer
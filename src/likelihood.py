@@ -7,7 +7,7 @@ from .quadrature import hermgauss, hermgaussquadrature
 
 
 class Likelihood(torch.nn.Module):
-    def __init__(self, dtype=torch.float64, device=None):
+    def __init__(self, dtype=torch.float32, device=None):
         """
         Represents a probability distribution of the target values
         given the model predictions
@@ -218,7 +218,7 @@ class Likelihood(torch.nn.Module):
 
 
 class Gaussian(Likelihood):
-    def __init__(self, log_variance=-5.0, dtype=torch.float64, device=None):
+    def __init__(self, log_variance=-5.0, dtype=torch.float32, device=None):
         """Gaussian Likelihood. Encapsulates the likelihood noise
         as a parameter.
 
@@ -3,7 +3,7 @@ import numpy as np
 
 
 class NoiseSampler:
-    def __init__(self, seed, device):
+    def __init__(self, seed, device=None, dtype=torch.float32):
         """
         Generates noise samples.
 
@@ -11,11 +11,14 @@ class NoiseSampler:
         -----------
         seed : int
                Integer value used to generate reproducible results.
+        device : torch.device
+                 The device in which the samples are returned.
         dtype : data-type
                 The dtype of the layer's computations and weights.
         """
         self.seed = seed
         self.device = device
+        self.dtype = dtype
         self.rng = np.random.default_rng(self.seed)
 
     def reset_seed(self):
@@ -46,7 +49,9 @@ class GaussianSampler(NoiseSampler):
 
         """
 
-        return torch.tensor(self.rng.standard_normal(size=size)).to(self.device)
+        return torch.tensor(
+            self.rng.standard_normal(size=size), dtype=self.dtype, device=self.device
+        )
 
 
 class UniformSampler(NoiseSampler):
@@ -65,24 +70,30 @@ class UniformSampler(NoiseSampler):
                   A sample from a Uniform distribution U(0, 1).
         """
 
-        return torch.tensor(self.rng.uniform(size=size))
+        return torch.tensor(
+            self.rng.uniform(size=size), dtype=self.dtype, device=self.device
+        )
 
 
 class GaussianSamplerSobol:
-    def __init__(self, seed):
+    def __init__(self, seed, dtype=torch.float32):
         self.seed = seed
+        self.dtype = dtype
 
     def __call__(self, size):
         soboleng = torch.quasirandom.SobolEngine(dimension=size[1], seed=self.seed)
-        draws = soboleng.draw(size[0], dtype=torch.float64) + 1e-6
-        m = torch.distributions.normal.Normal(torch.tensor([0.0]), torch.tensor([1.0]))
+        draws = soboleng.draw(size[0], dtype=self.dtype) + 1e-6
+        m = torch.distributions.normal.Normal(
+            torch.tensor([0.0], dtype=self.dtype), torch.tensor([1.0], dtype=self.dtype)
+        )
         return torch.reshape(m.icdf(draws), shape=size)
 
 
 class UniformSamplerSobol:
-    def __init__(self, seed):
+    def __init__(self, seed, dtype=torch.float32):
         self.seed = seed
+        self.dtype = dtype
 
     def __call__(self, size):
         soboleng = torch.quasirandom.SobolEngine(dimension=size[1], seed=self.seed)
-        return torch.reshape(soboleng.draw(size[0], dtype=torch.float64), shape=size)
+        return torch.reshape(soboleng.draw(size[0], dtype=self.dtype), shape=size)
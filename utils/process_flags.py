@@ -24,6 +24,17 @@ def manage_experiment_configuration(args=None):
         args.device = torch.device("cuda:0" if use_cuda else "cpu")
         torch.backends.cudnn.benchmark = True
 
+    # Data types are needed by the likelihoods created below
+    if args.dtype == "float64":
+        FLAGS["dtype"] = torch.float64
+    elif args.dtype == "float32":
+        FLAGS["dtype"] = torch.float32
+
+    if args.cholesky_dtype == "float64":
+        FLAGS["cholesky_dtype"] = torch.float64
+    elif args.cholesky_dtype == "float32":
+        FLAGS["cholesky_dtype"] = torch.float32
+
     # Manage Dataset
     args.dataset = get_dataset(args.dataset_name)
 
@@ -71,9 +82,6 @@ def manage_experiment_configuration(args=None):
     else:
         raise ValueError("Invalid BNN activation type.")
 
-    if args.dtype == "float64":
-        FLAGS["dtype"] = torch.float64
-
     len_train = args.dataset.len_train(args.test_size)
     args.batch_size = min(args.batch_size, len_train)
     if args.epochs is None:
@@ -311,6 +319,14 @@ def get_parser():
     )
     parser.set_defaults(inducing_layer=False)
 
+    parser.add_argument(
+        "--compile_layers",
+        dest="compile_layers",
+        action="store_true",
+        help="Compile the forward pass of the VIP layers (requires PyTorch >= 2.2).",
+    )
+    parser.set_defaults(compile_layers=False)
+
     parser.add_argument(
         "--show",
         dest="show",
@@ -323,6 +339,13 @@ def get_parser():
         "--verbose", type=int, default=1, help="Set to 0 to disable messages."
     )
     parser.add_argument("--dtype", type=str, default=torch.float64, help="Data type")
+    parser.add_argument(
+        "--cholesky_dtype",
+        type=str,
+        default=None,
+        choices=["float32", "float64"],
+        help="Data type of the Cholesky decomposition of Ku in inducing layers.",
+    )
     parser.add_argument("--split", default=None, type=int, help="Data split to use.")
     parser.add_argument("--name_flag", default="", type=str)
 